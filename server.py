@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 import os
 import time
+import types
 import signal
+import functools
 import threading
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Mapping, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import shutil
-from collections import deque, Counter
 
 import cv2
 import numpy as np
 from flask import Flask, Response, request
 
+try:
+    from numba import njit, prange
+except ImportError:   # numba is optional; the pure-Python fallbacks below work as-is
+    njit = None
+    prange = range
+
 app = Flask(__name__)
 
 CAMERA = os.environ.get("CAMERA", "/dev/video0")
@@ -19,17 +27,26 @@ HEIGHT = int(os.environ.get("HEIGHT", 480))
 FPS    = int(os.environ.get("FPS", 30))
 QUAL   = int(os.environ.get("JPEG_QUALITY", 80))   # 1~100
 BOUNDARY = os.environ.get("BOUNDARY", "frame")
+CAPTURE_YUYV = os.environ.get("CAPTURE_YUYV", "1") == "1"
+# Driver-side capture queue depth. 1 means cap.read() always returns the
+# newest frame, so no stale-frame backlog builds up when a stage stalls.
+CAP_BUFFERS = int(os.environ.get("CAP_BUFFERS", 1))
 
 DETECT_DOWNSCALE = float(os.environ.get("DETECT_DOWNSCALE", 0.4))
 # Haar var
 HAAR_SCALE_FACTOR = float(os.environ.get("HAAR_SCALE_FACTOR", 1.2))
 HAAR_MIN_NEIGHBORS = int(os.environ.get("HAAR_MIN_NEIGHBORS", 4))
 HAAR_MIN_SIZE = int(os.environ.get("HAAR_MIN_SIZE", 36))
+USE_OPENCL = os.environ.get("USE_OPENCL", "1") == "1"
 
 ENABLE_RECOG = os.environ.get("ENABLE_RECOG", "1") == "1"
 RECOG_DATA_DIR = os.environ.get("RECOG_DATA_DIR", "faces")
 RECOG_THRESHOLD = float(os.environ.get("RECOG_THRESHOLD", 11))
 RECOG_IMG_SIZE = int(os.environ.get("RECOG_IMG_SIZE", 96))
+# Optional embedding backend: point RECOG_ONNX_MODEL at a small face-embedding
+# ONNX model (e.g. MobileFaceNet) to replace LBPH with cosine matching.
+RECOG_ONNX_MODEL = os.environ.get("RECOG_ONNX_MODEL", "")
+RECOG_EMB_THRESHOLD = float(os.environ.get("RECOG_EMB_THRESHOLD", 0.35))
 
 LOG_EVERY_SEC   = float(os.environ.get("LOG_EVERY_SEC", 5.0))
 PRINT_STATS     = os.environ.get("PRINT_STATS", "1") == "1"
@@ -37,21 +54,79 @@ DETECT_EVERY_N  = int(os.environ.get("DETECT_EVERY_N", 1))
 RECOG_EVERY_N   = int(os.environ.get("RECOG_EVERY_N", 2))
 
 RECOG_MIN_SIDE  = int(os.environ.get("RECOG_MIN_SIDE", 48))
+# Skip detect/recognize/encode when the 16x16 thumbnail SAD against the last
+# processed frame is below this; 0 disables the gate.
+MOTION_SAD_THRESH = int(os.environ.get("MOTION_SAD_THRESH", 1500))
 VOTE_WINDOW     = int(os.environ.get("VOTE_WINDOW", 5))
 VOTE_REQUIRE    = int(os.environ.get("VOTE_REQUIRE", 3))
 
 latest_jpeg_frame: Optional[bytes] = None
-latest_bgr_frame: Optional[np.ndarray] = None
 frame_lock = threading.Lock()
+# Signalled once per published frame so stream clients pace off the real
+# camera rate instead of sleeping 1/FPS.
+frame_ready = threading.Condition(frame_lock)
+latest_frame_seq = 0
 stop_event = threading.Event()
 
-current_people: List[dict] = []
+# Gray frames live in a small ring of preallocated buffers: the detection
+# thread writes into the next slot and publishes its index right away, so the
+# hot path never allocates or copies a frame.
+GRAY_RING_N = 3
+_gray_ring: List[np.ndarray] = []
+latest_gray_idx = -1
+
+def _latest_gray() -> Optional[np.ndarray]:
+    # Capture consumers hold the image across a slow detect while the ring
+    # writer reuses the slot a few frames later, so hand them a copy; one
+    # frame-sized memcpy per capture request is negligible at request rate.
+    with frame_lock:
+        idx = latest_gray_idx
+        return _gray_ring[idx].copy() if idx >= 0 else None
+
+# Prefer libjpeg-turbo's SIMD encoder when PyTurboJPEG is installed; it
+# returns bytes directly, skipping cv2.imencode's numpy round-trip.
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420, TJFLAG_FASTDCT
+    _TURBO = TurboJPEG()
+except Exception:
+    _TURBO = None
+
+_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), QUAL]
+
+def _encode_jpeg(frame: np.ndarray) -> Optional[bytes]:
+    if _TURBO is not None:
+        return _TURBO.encode(frame, quality=QUAL,
+                             jpeg_subsample=TJSAMP_420, flags=TJFLAG_FASTDCT)
+    ok, buf = cv2.imencode(".jpg", frame, _JPEG_PARAMS)
+    return buf.tobytes() if ok else None
+
+def _encode_and_publish(frame: np.ndarray):
+    # Runs on the encoder worker; the detection loop hands over ownership of
+    # `frame` (a fresh array each iteration) and never touches it again.
+    global latest_jpeg_frame, latest_frame_seq
+    jpeg = _encode_jpeg(frame)
+    if jpeg is None:
+        return
+    with frame_ready:
+        latest_jpeg_frame = jpeg
+        latest_frame_seq += 1
+        frame_ready.notify_all()
+
+# Faces currently in view, stored as fixed-capacity columns (SoA) instead of
+# a rebuilt list of dicts: the detection thread refreshes the slices in place
+# each frame and /recog/current serializes them on demand.
+MAX_FACES = int(os.environ.get("MAX_FACES", 8))
 current_people_lock = threading.Lock()
+_people_bbox = np.zeros((MAX_FACES, 4), np.int32)
+_people_conf = np.full(MAX_FACES, np.nan, np.float32)
+_people_ts = np.zeros(MAX_FACES, np.float64)
+_people_labels: List[Optional[str]] = [None] * MAX_FACES
+_people_n = 0
 CURRENT_EXPIRE_SEC = float(os.environ.get("CURRENT_EXPIRE_SEC", 1.5))
 
 recognizer_lock = threading.Lock()
-label2id: Dict[str, int] = {}
-id2label: Dict[int, str] = {}
+label2id: Mapping[str, int] = {}
+id2label: Mapping[int, str] = {}
 recognizer = None  # type: ignore
 
 CASCADE_PATH = os.path.join(os.path.dirname(__file__), "haarcascade_frontalface_default.xml")
@@ -64,7 +139,7 @@ def _ensure_opencv_contrib():
     if not hasattr(cv2, "face"):
         raise RuntimeError("OpenCV 'contrib' module uninstalld")
 
-def open_capture() -> cv2.VideoCapture:
+def open_capture() -> Tuple[cv2.VideoCapture, bool]:
     try:
         os.system(f"v4l2-ctl -d {CAMERA} -p {FPS} >/dev/null 2>&1")
     except Exception:
@@ -75,32 +150,265 @@ def open_capture() -> cv2.VideoCapture:
     cap.set(cv2.CAP_PROP_FRAME_WIDTH,  WIDTH)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
     cap.set(cv2.CAP_PROP_FPS,          FPS)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE,   4)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE,   CAP_BUFFERS)
+
+    # Ask the driver for raw YUYV so the Y plane doubles as the gray image
+    # (saves a full BGR2GRAY per frame). Fall back to BGR if it refuses.
+    raw_yuyv = False
+    if CAPTURE_YUYV:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"YUYV"))
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
 
     for _ in range(5):
-        ok, _ = cap.read()
-        if ok: break
+        ok, probe = cap.read()
+        if ok:
+            raw_yuyv = CAPTURE_YUYV and probe is not None and probe.size == WIDTH * HEIGHT * 2
+            break
         time.sleep(0.02)
-    return cap
+    # Whenever we end up on the BGR path — including when every probe read
+    # failed — undo CONVERT_RGB=0 so later reads never hand raw YUYV to the
+    # BGR branch of the detection loop.
+    if CAPTURE_YUYV and not raw_yuyv:
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    return cap, raw_yuyv
+
+_IMG_EXTS = (".jpg", ".jpeg", ".png")
 
 def _iter_face_paths(root: str):
+    # scandir reuses the readdir type info, avoiding a stat() per entry
     if not os.path.isdir(root):
         return
-    for label in sorted(os.listdir(root)):
-        d = os.path.join(root, label)
-        if not os.path.isdir(d):
+    with os.scandir(root) as it:
+        dirs = sorted((e.name, e.path) for e in it if e.is_dir())
+    for label, d in dirs:
+        with os.scandir(d) as it:
+            files = sorted(e.path for e in it
+                           if e.is_file() and e.name.lower().endswith(_IMG_EXTS))
+        for path in files:
+            yield label, path
+
+@functools.lru_cache(maxsize=32)
+def _area_resize_plan(src_h: int, src_w: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row/column area-weight matrices for the fixed 96x96 destination.
+
+    INTER_AREA pixel contributions depend only on the source size, so each
+    distinct source shape builds its plan once; the resize itself is then
+    two small matmuls (rows, then columns).
+    """
+    def axis_weights(n_src: int) -> np.ndarray:
+        scale = n_src / RECOG_IMG_SIZE
+        lo = np.arange(RECOG_IMG_SIZE, dtype=np.float32) * scale
+        hi = lo + scale
+        s = np.arange(n_src, dtype=np.float32)
+        w = np.minimum(hi[:, None], s[None, :] + 1.0) - np.maximum(lo[:, None], s[None, :])
+        np.clip(w, 0.0, None, out=w)
+        w /= w.sum(axis=1, keepdims=True)
+        return w
+    return axis_weights(src_h), axis_weights(src_w).T
+
+def _prepare_face(gray: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    # Callers that keep the result (training, enroll) omit dst; the detection
+    # loop passes its scratch buffer to avoid a fresh allocation per face.
+    h, w = gray.shape[:2]
+    if h == RECOG_IMG_SIZE and w == RECOG_IMG_SIZE:
+        if dst is not None:
+            np.copyto(dst, gray)
+            return dst
+        return gray.copy()
+    wr, wc = _area_resize_plan(h, w)
+    out = wr @ gray.astype(np.float32) @ wc
+    np.rint(out, out=out)
+    if dst is not None:
+        np.copyto(dst, out, casting="unsafe")
+        return dst
+    return out.astype(np.uint8)
+
+def _lbp_histograms(img: np.ndarray, grid: int) -> np.ndarray:
+    """Per-cell-normalized 256-bin LBP histograms over a grid x grid tiling,
+    flattened to one (grid*grid*256,) float32 vector. Loop-style for numba."""
+    h = img.shape[0]
+    w = img.shape[1]
+    hist = np.zeros(grid * grid * 256, np.float32)
+    ch = max(1, h // grid)
+    cw = max(1, w // grid)
+    for y in range(1, h - 1):
+        cy = min(y // ch, grid - 1)
+        for x in range(1, w - 1):
+            c = img[y, x]
+            code = 0
+            if img[y-1, x-1] >= c: code |= 1
+            if img[y-1, x  ] >= c: code |= 2
+            if img[y-1, x+1] >= c: code |= 4
+            if img[y,   x+1] >= c: code |= 8
+            if img[y+1, x+1] >= c: code |= 16
+            if img[y+1, x  ] >= c: code |= 32
+            if img[y+1, x-1] >= c: code |= 64
+            if img[y,   x-1] >= c: code |= 128
+            cx = min(x // cw, grid - 1)
+            hist[(cy * grid + cx) * 256 + code] += 1.0
+    for cell in range(grid * grid):
+        base = cell * 256
+        s = 0.0
+        for k in range(256):
+            s += hist[base + k]
+        if s > 0:
+            for k in range(256):
+                hist[base + k] /= s
+    return hist
+
+def _chi2_scores(train_hists: np.ndarray, query: np.ndarray) -> np.ndarray:
+    # Chi-square distance of the query histogram against every training row;
+    # prange spreads the rows across cores under numba.
+    n = train_hists.shape[0]
+    d = train_hists.shape[1]
+    out = np.empty(n, np.float32)
+    for i in prange(n):
+        s = 0.0
+        for k in range(d):
+            a = train_hists[i, k]
+            b = query[k]
+            denom = a + b
+            if denom > 1e-9:
+                diff = a - b
+                s += diff * diff / denom
+        out[i] = s
+    return out
+
+if njit is not None:
+    _lbp_histograms = njit(cache=True)(_lbp_histograms)
+    _chi2_scores = njit(parallel=True, fastmath=True, cache=True)(_chi2_scores)
+
+class _LBPHMatcher:
+    """LBPH nearest-neighbour matcher on precomputed histograms.
+
+    Training histograms live in one contiguous (N, grid*grid*256) float32
+    matrix computed once at train time; predict computes the query histogram
+    once and runs a parallel chi-square scan. Replaces the contrib LBPH
+    recognizer when numba is available to compile the kernels.
+    """
+
+    def __init__(self, grid: int = 4):
+        self.grid = grid
+        self.hists: Optional[np.ndarray] = None
+        self.ids: Optional[np.ndarray] = None
+
+    def train(self, X: List[np.ndarray], y: np.ndarray):
+        self.hists = np.stack([_lbp_histograms(img, self.grid) for img in X])
+        self.ids = np.asarray(y, np.int32)
+
+    def predict(self, face: np.ndarray) -> Tuple[int, float]:
+        scores = _chi2_scores(self.hists, _lbp_histograms(face, self.grid))
+        best = int(scores.argmin())
+        return int(self.ids[best]), float(scores[best])
+
+class _EmbeddingRecognizer:
+    """Cosine-distance matcher over embeddings from a small ONNX face model.
+
+    Same train/predict surface as the LBPH recognizer; predict returns
+    (label_id, distance) where distance is 1 - cosine similarity.
+    """
+
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = 2
+        self.session = ort.InferenceSession(
+            model_path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        shape = inp.shape  # (1, C, H, W)
+        self.channels = int(shape[1]) if isinstance(shape[1], int) else 1
+        self.input_size = int(shape[2]) if isinstance(shape[2], int) else 112
+        self.threshold = RECOG_EMB_THRESHOLD
+        self.embeddings: Optional[np.ndarray] = None  # (N, D) float32, L2-normalized
+        self.ids: Optional[np.ndarray] = None
+
+    def _embed(self, face: np.ndarray) -> np.ndarray:
+        img = cv2.resize(face, (self.input_size, self.input_size),
+                         interpolation=cv2.INTER_LINEAR)
+        blob = (img.astype(np.float32) - 127.5) / 128.0
+        if self.channels == 3:
+            blob = np.repeat(blob[np.newaxis, :, :], 3, axis=0)
+        else:
+            blob = blob[np.newaxis, :, :]
+        emb = self.session.run(None, {self.input_name: blob[np.newaxis]})[0][0]
+        emb = emb.astype(np.float32)
+        n = float(np.linalg.norm(emb))
+        return emb / n if n > 0 else emb
+
+    def train(self, X: List[np.ndarray], y: np.ndarray):
+        self.embeddings = np.stack([self._embed(f) for f in X])
+        self.ids = np.asarray(y, np.int32)
+
+    def predict(self, face: np.ndarray) -> Tuple[int, float]:
+        scores = self.embeddings @ self._embed(face)   # one dot-product per sample
+        best = int(scores.argmax())
+        return int(self.ids[best]), float(1.0 - scores[best])
+
+def _aggregate_votes(ids: np.ndarray, confs: np.ndarray, require: int) -> Tuple[int, float]:
+    """Majority vote over the prediction window; ids < 0 mean empty/unknown.
+
+    Returns (label_id, mean_conf); label_id is -1 when no label reaches
+    `require` votes. Written loop-style so numba can compile it when present.
+    """
+    best_id = -1
+    best_votes = 0
+    n = ids.shape[0]
+    for i in range(n):
+        v = ids[i]
+        if v < 0:
             continue
-        for fn in sorted(os.listdir(d)):
-            if fn.lower().endswith((".jpg", ".jpeg", ".png")):
-                yield label, os.path.join(d, fn)
-
-def _prepare_face(gray: np.ndarray) -> np.ndarray:
-    return cv2.resize(gray, (RECOG_IMG_SIZE, RECOG_IMG_SIZE), interpolation=cv2.INTER_AREA)
+        votes = 0
+        for j in range(n):
+            if ids[j] == v:
+                votes += 1
+        if votes > best_votes:
+            best_votes = votes
+            best_id = v
+    if best_id < 0 or best_votes < require:
+        return -1, np.nan
+    s = 0.0
+    m = 0
+    for j in range(n):
+        if ids[j] == best_id and not np.isnan(confs[j]):
+            s += confs[j]
+            m += 1
+    return best_id, (s / m) if m > 0 else np.nan
+
+if njit is not None:
+    _aggregate_votes = njit(cache=True)(_aggregate_votes)
+
+# Prefer the AOT-compiled kernels when the optional extension has been built
+# (python setup_hot.py build_ext --inplace); they override both the numba and
+# pure-Python versions above.
+try:
+    import server_hot as _hot
+except ImportError:
+    _hot = None
+if _hot is not None:
+    _aggregate_votes = _hot.aggregate_votes
+    _lbp_histograms = _hot.lbp_histograms
+    _chi2_scores = _hot.chi2_scores
+
+def _bbox_order(faces: np.ndarray) -> np.ndarray:
+    # Largest-area-first iteration order, computed in one vectorized pass.
+    areas = faces[:, 2].astype(np.int32) * faces[:, 3]
+    return np.argsort(-areas)
+
+def _largest_face(faces) -> Tuple[int, int, int, int]:
+    faces = np.asarray(faces, np.int32)
+    areas = faces[:, 2] * faces[:, 3]
+    x, y, w, h = faces[int(areas.argmax())]
+    return int(x), int(y), int(w), int(h)
 
 def train_recognizer_from_dir(root: str) -> Tuple[Optional[object], Dict[str, int], Dict[int, str]]:
     if not ENABLE_RECOG:
         return None, {}, {}
-    _ensure_opencv_contrib()
+    use_onnx = bool(RECOG_ONNX_MODEL) and os.path.isfile(RECOG_ONNX_MODEL)
+    use_native_lbph = not use_onnx and (njit is not None or _hot is not None)
+    if not use_onnx and not use_native_lbph:
+        _ensure_opencv_contrib()
 
     X: List[np.ndarray] = []
     y: List[int] = []
@@ -108,27 +416,43 @@ def train_recognizer_from_dir(root: str) -> Tuple[Optional[object], Dict[str, in
     i2l: Dict[int, str] = {}
     next_id = 0
 
-    for pair in _iter_face_paths(root) or []:
+    def _load(pair):
         label, path = pair
         try:
             img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
             if img is None:
-                continue
-            face_img = _prepare_face(img)
-            X.append(face_img)
-            if label not in l2i:
-                l2i[label] = next_id
-                i2l[next_id] = label
-                next_id += 1
-            y.append(l2i[label])
+                return label, None
+            return label, _prepare_face(img)
         except Exception as e:
             print(f"load {path}failed: {e}")
+            return label, None
+
+    # imread/resize release the GIL, so decode scales with cores; paths are
+    # already sorted and map preserves order, keeping label ids deterministic.
+    paths = list(_iter_face_paths(root) or [])
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        results = list(ex.map(_load, paths))
+
+    for label, face_img in results:
+        if face_img is None:
+            continue
+        X.append(face_img)
+        if label not in l2i:
+            l2i[label] = next_id
+            i2l[next_id] = label
+            next_id += 1
+        y.append(l2i[label])
 
     if not X:
         print("no image found")
         return None, {}, {}
 
-    rec = cv2.face.LBPHFaceRecognizer_create(radius=1, neighbors=8, grid_x=4, grid_y=4)
+    if use_onnx:
+        rec = _EmbeddingRecognizer(RECOG_ONNX_MODEL)
+    elif use_native_lbph:
+        rec = _LBPHMatcher(grid=4)
+    else:
+        rec = cv2.face.LBPHFaceRecognizer_create(radius=1, neighbors=8, grid_x=4, grid_y=4)
     rec.train(X, np.array(y))
     return rec, l2i, i2l
 
@@ -136,19 +460,21 @@ def reload_recognizer() -> bool:
     global recognizer, label2id, id2label
     try:
         rec, l2i, i2l = train_recognizer_from_dir(RECOG_DATA_DIR)
+        # Published as read-only proxies and only ever swapped wholesale, so
+        # readers can take a bare reference without the lock or a copy.
         with recognizer_lock:
             recognizer = rec
-            label2id = l2i
-            id2label = i2l
+            label2id = types.MappingProxyType(l2i)
+            id2label = types.MappingProxyType(i2l)
         return True
     except Exception as e:
         print(f"train failed: {e}")
         return False
 
 def detection_loop():
-    global latest_jpeg_frame, latest_bgr_frame, current_people
+    global _people_n, latest_gray_idx, latest_frame_seq
 
-    cap = open_capture()
+    cap, raw_yuyv = open_capture()
     if not cap.isOpened():
         print(f"Cannot open camera: {CAMERA}")
         return
@@ -161,8 +487,48 @@ def detection_loop():
     last_log = time.time()
     frame_idx = 0
 
+    small_buf: Optional[np.ndarray] = None
+    face_buf = np.empty((RECOG_IMG_SIZE, RECOG_IMG_SIZE), np.uint8)
+
+    small16 = np.empty((16, 16), np.uint8)
+    prev_small16 = np.empty((16, 16), np.uint8)
+    have_prev16 = False
+
+    # Sanitize the cadences once; power-of-two intervals fold to a mask.
+    det_n = max(1, DETECT_EVERY_N)
+    rec_n = max(1, RECOG_EVERY_N)
+    det_mask = det_n - 1 if det_n & (det_n - 1) == 0 else None
+    rec_mask = rec_n - 1 if rec_n & (rec_n - 1) == 0 else None
+
+    # Run the cascade through UMat when an OpenCL device is present so the
+    # integral image + cascade stages go to the GPU; CPU-only boards keep
+    # the plain numpy path.
+    use_ocl = USE_OPENCL and cv2.ocl.haveOpenCL()
+    if use_ocl:
+        cv2.ocl.setUseOpenCL(True)
+        print("OpenCL device found, Haar cascade via UMat")
+
+    # One encoder worker pipelines the JPEG stage with the next cap.read();
+    # if an encode is still in flight the frame is simply not re-encoded.
+    enc_pool = ThreadPoolExecutor(max_workers=1)
+    enc_fut = None
+
     faces_fullres: List[tuple] = []
-    pred_hist = deque(maxlen=max(1, VOTE_WINDOW))  # multi frame vote
+    faces_small: List[tuple] = []   # same boxes in `small` coords, for recognition crops
+
+    # Per-frame staging for the current_people columns; copied into the
+    # published arrays in one shot under the lock.
+    people_bbox = np.zeros((MAX_FACES, 4), np.int32)
+    people_conf = np.full(MAX_FACES, np.nan, np.float32)
+    people_ts = np.zeros(MAX_FACES, np.float64)
+    people_labels: List[Optional[str]] = [None] * MAX_FACES
+
+    # multi frame vote: fixed-size ring of (label_id, conf) instead of a deque
+    # of tuples — no per-frame allocation and numba-friendly aggregation
+    vote_n = max(1, VOTE_WINDOW)
+    vote_ids = np.full(vote_n, -1, np.int32)
+    vote_confs = np.full(vote_n, np.nan, np.float32)
+    vote_pos = 0
 
     while not stop_event.is_set():
         ok, frame = cap.read()
@@ -173,57 +539,112 @@ def detection_loop():
         frames += 1
         frame_idx += 1
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        do_detect = (frame_idx % max(1, DETECT_EVERY_N) == 0)
+        is_raw = raw_yuyv and frame.size == WIDTH * HEIGHT * 2
+        if not _gray_ring:
+            gh, gw = (HEIGHT, WIDTH) if is_raw else frame.shape[:2]
+            for _ in range(GRAY_RING_N):
+                _gray_ring.append(np.empty((gh, gw), np.uint8))
+
+        ring_idx = frame_idx % GRAY_RING_N
+        gray = _gray_ring[ring_idx]
+        if is_raw:
+            yuyv = frame.reshape(HEIGHT, WIDTH, 2)
+            np.copyto(gray, yuyv[:, :, 0])  # Y plane is already grayscale
+            frame = cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+
+        # Publish the slot as soon as it is complete — from this thread, not
+        # the encoder worker — so the index stays fresh on every frame
+        # (motion-gated and encode-skipped ones included) and the writer is
+        # always a full ring cycle away from the published slot.
+        with frame_lock:
+            latest_gray_idx = ring_idx
+        do_detect = (frame_idx & det_mask) == 0 if det_mask is not None else (frame_idx % det_n == 0)
 
         if 0 < DETECT_DOWNSCALE < 1.0:
-            small = cv2.resize(
-                gray,
-                (int(gray.shape[1]*DETECT_DOWNSCALE), int(gray.shape[0]*DETECT_DOWNSCALE)),
-                interpolation=cv2.INTER_AREA
-            )
+            if small_buf is None:
+                small_buf = np.empty(
+                    (int(gray.shape[0]*DETECT_DOWNSCALE), int(gray.shape[1]*DETECT_DOWNSCALE)),
+                    np.uint8
+                )
+            cv2.resize(gray, (small_buf.shape[1], small_buf.shape[0]),
+                       dst=small_buf, interpolation=cv2.INTER_AREA)
+            small = small_buf
             scale = 1.0 / DETECT_DOWNSCALE
         else:
             small = gray
             scale = 1.0
 
+        # Motion gate: on a near-identical frame, keep the cached boxes and
+        # jpeg, refresh the people timestamps, and skip the heavy stages.
+        # prev_small16 tracks the last *processed* frame so slow drift still
+        # trips the threshold eventually.
+        if MOTION_SAD_THRESH > 0:
+            cv2.resize(small, (16, 16), dst=small16, interpolation=cv2.INTER_AREA)
+            if have_prev16:
+                sad = int(np.abs(small16.astype(np.int16) - prev_small16).sum())
+                if sad < MOTION_SAD_THRESH:
+                    with current_people_lock:
+                        _people_ts[:_people_n] = time.time()
+                    with frame_ready:
+                        if latest_jpeg_frame is not None:
+                            latest_frame_seq += 1
+                            frame_ready.notify_all()
+                    continue
+            np.copyto(prev_small16, small16)
+            have_prev16 = True
+
         if do_detect:
+            det_input = cv2.UMat(small) if use_ocl else small
             with FACE_LOCK:
                 faces = FACE_CASCADE.detectMultiScale(
-                    small,
+                    det_input,
                     scaleFactor=HAAR_SCALE_FACTOR,
                     minNeighbors=HAAR_MIN_NEIGHBORS,
                     minSize=(HAAR_MIN_SIZE, HAAR_MIN_SIZE),
                     flags=cv2.CASCADE_SCALE_IMAGE
                 )
+            faces_small = [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
             faces_fullres = [(int(x*scale), int(y*scale), int(w*scale), int(h*scale)) for (x,y,w,h) in faces]
 
-        do_recog = (frame_idx % max(1, RECOG_EVERY_N) == 0)
+        do_recog = (frame_idx & rec_mask) == 0 if rec_mask is not None else (frame_idx % rec_n == 0)
 
-        with recognizer_lock:
-            rec = recognizer
-            labels = id2label.copy()
+        # Bare reads are atomic under the GIL and the snapshots are immutable;
+        # no per-frame lock or dict copy.
+        rec = recognizer
+        labels = id2label
+        thr = getattr(rec, "threshold", RECOG_THRESHOLD)  # embedding backend carries its own
 
-        faces_out = []
         best_for_vote = None
-        faces_iter = sorted(faces_fullres, key=lambda b: b[2]*b[3], reverse=True)
+        order = _bbox_order(np.asarray(faces_fullres, np.int32)) if faces_fullres else ()
 
-        for idx, (x0, y0, w0, h0) in enumerate(faces_iter):
+        for idx, fi in enumerate(order):
+            x0, y0, w0, h0 = faces_fullres[fi]
             cv2.rectangle(frame, (x0, y0), (x0+w0, y0+h0), (0, 255, 0), 2)
             name_text = "unknown"
             conf_val = None
+            face_id = -1
 
             recognizable = (min(w0, h0) >= RECOG_MIN_SIDE)
 
             if rec is not None and do_recog and recognizable:
-                crop = gray[y0:y0+h0, x0:x0+w0]
+                # Crop from the already-downscaled image when it still has
+                # enough pixels for the recognizer; the 96x96 resize then
+                # touches ~6x fewer bytes than a full-res crop.
+                sx, sy, sw_, sh_ = faces_small[fi]
+                if min(sw_, sh_) >= RECOG_IMG_SIZE:
+                    crop = small[sy:sy+sh_, sx:sx+sw_]
+                else:
+                    crop = gray[y0:y0+h0, x0:x0+w0]
                 if crop.size > 0:
-                    face_img = _prepare_face(crop)
+                    face_img = _prepare_face(crop, dst=face_buf)
                     try:
                         pred_id, conf = rec.predict(face_img)
                         conf_val = float(conf)
-                        if conf <= RECOG_THRESHOLD and pred_id in labels:
+                        if conf <= thr and pred_id in labels:
                             name_text = labels[pred_id]
+                            face_id = int(pred_id)
                         else:
                             name_text = "unknown"
                     except Exception:
@@ -239,41 +660,42 @@ def detection_loop():
                 cv2.putText(frame, txt, (x0, y0-6), cv2.FONT_HERSHEY_SIMPLEX,
                             0.5, (0, 255, 0), 1, cv2.LINE_AA)
 
-            faces_out.append({
-                "label": name_text,
-                "conf": conf_val,
-                "bbox": [int(x0), int(y0), int(w0), int(h0)],
-                "ts": time.time()
-            })
+            if idx < MAX_FACES:
+                people_bbox[idx] = (x0, y0, w0, h0)
+                people_conf[idx] = np.nan if conf_val is None else conf_val
+                people_ts[idx] = time.time()
+                people_labels[idx] = name_text
 
             if idx == 0 and do_recog:
-                best_for_vote = (name_text, conf_val)
+                best_for_vote = (face_id, conf_val)
 
-        # update current_people
+        # update current_people columns
+        n_faces = min(len(order), MAX_FACES)
         with current_people_lock:
-            current_people = faces_out
+            _people_n = n_faces
+            _people_bbox[:n_faces] = people_bbox[:n_faces]
+            _people_conf[:n_faces] = people_conf[:n_faces]
+            _people_ts[:n_faces] = people_ts[:n_faces]
+            _people_labels[:n_faces] = people_labels[:n_faces]
 
         if do_recog:
-            pred_hist.append(best_for_vote if best_for_vote is not None else ("unknown", None))
+            fid, fconf = best_for_vote if best_for_vote is not None else (-1, None)
+            vote_ids[vote_pos] = fid
+            vote_confs[vote_pos] = np.nan if fconf is None else fconf
+            vote_pos = (vote_pos + 1) % vote_n
 
-        labels_in_window = [p[0] for p in pred_hist if p[0] != "unknown"]
         final_text = "unknown"
-        if labels_in_window:
-            c = Counter(labels_in_window)
-            label_top, votes = c.most_common(1)[0]
-            if votes >= VOTE_REQUIRE:
-                confs = [p[1] for p in pred_hist if p[0] == label_top and p[1] is not None]
-                final_text = f"{label_top} ({np.mean(confs):.1f})" if confs else label_top
+        top_id, mean_conf = _aggregate_votes(vote_ids, vote_confs, VOTE_REQUIRE)
+        if top_id >= 0 and top_id in labels:
+            label_top = labels[top_id]
+            final_text = label_top if np.isnan(mean_conf) else f"{label_top} ({mean_conf:.1f})"
 
         for (x0, y0, w0, h0) in faces_fullres:
             cv2.putText(frame, final_text, (x0, y0-6), cv2.FONT_HERSHEY_SIMPLEX,
                         0.6, (0, 255, 0), 2, cv2.LINE_AA)
 
-        ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), QUAL])
-        if ok:
-            with frame_lock:
-                latest_jpeg_frame = buf.tobytes()
-                latest_bgr_frame = frame
+        if enc_fut is None or enc_fut.done():
+            enc_fut = enc_pool.submit(_encode_and_publish, frame)
 
         now = time.time()
         if PRINT_STATS and (now - last_log) >= LOG_EVERY_SEC:
@@ -285,21 +707,34 @@ def detection_loop():
             last_log = now
             t_stat, frames = now, 0
 
+    enc_pool.shutdown(wait=False)
     cap.release()
     print("detection loop stopped")
 
+_MJPEG_PREAMBLE = (b"--" + BOUNDARY.encode() + b"\r\n"
+                   b"Content-Type: image/jpeg\r\n"
+                   b"Content-Length: ")
+
 def mjpeg_generator():
+    last_seq = -1
     while not stop_event.is_set():
-        with frame_lock:
+        # Wake exactly once per published frame; the timeout only guards
+        # shutdown and camera stalls.
+        with frame_ready:
+            frame_ready.wait_for(lambda: latest_frame_seq != last_seq, timeout=1.0)
             fb = latest_jpeg_frame
+            last_seq = latest_frame_seq
         if fb is None:
-            time.sleep(0.02)
             continue
-        yield (b"--" + BOUNDARY.encode() + b"\r\n"
-               b"Content-Type: image/jpeg\r\n"
-               b"Content-Length: " + str(len(fb)).encode() + b"\r\n\r\n" +
-               fb + b"\r\n")
-        time.sleep(max(0.0, 1.0 / FPS))
+        # Yield the part as separate chunks so the server writes them
+        # vectored instead of concatenating a fresh jpeg-sized bytes object
+        # per frame per viewer. fb is immutable bytes, so yielding it as-is
+        # is already zero-copy (and werkzeug only accepts bytes chunks).
+        yield _MJPEG_PREAMBLE
+        yield str(len(fb)).encode()
+        yield b"\r\n\r\n"
+        yield fb
+        yield b"\r\n"
 
 capture_thread = None
 capture_event = threading.Event()
@@ -314,12 +749,10 @@ capture_state = {
 }
 
 def _save_one_face(label: str, face_only: bool = True) -> Optional[str]:
-    with frame_lock:
-        frame = None if latest_bgr_frame is None else latest_bgr_frame.copy()
-    if frame is None:
+    gray = _latest_gray()
+    if gray is None:
         return None
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     with FACE_LOCK:
         faces = FACE_CASCADE.detectMultiScale(
             gray,
@@ -330,7 +763,7 @@ def _save_one_face(label: str, face_only: bool = True) -> Optional[str]:
         )
     if len(faces) == 0:
         return None
-    x, y, w, h = max(faces, key=lambda f: f[2]*f[3])
+    x, y, w, h = _largest_face(faces)
     roi = gray[y:y+h, x:x+w] if face_only else gray
     if roi.size == 0:
         return None
@@ -642,11 +1075,12 @@ def api_labels():
 def _label_counts() -> Dict[str, int]:
     counts = {}
     if os.path.isdir(RECOG_DATA_DIR):
-        for d in sorted(os.listdir(RECOG_DATA_DIR)):
-            p = os.path.join(RECOG_DATA_DIR, d)
-            if os.path.isdir(p):
-                n = sum(1 for fn in os.listdir(p) if fn.lower().endswith((".jpg", ".jpeg", ".png")))
-                counts[d] = n
+        with os.scandir(RECOG_DATA_DIR) as it:
+            dirs = sorted((e.name, e.path) for e in it if e.is_dir())
+        for name, p in dirs:
+            with os.scandir(p) as it:
+                counts[name] = sum(1 for e in it
+                                   if e.is_file() and e.name.lower().endswith(_IMG_EXTS))
     return counts
 
 @app.post("/recog/delete")
@@ -701,12 +1135,10 @@ def api_capture():
     if not label:
         return {"ok": False, "error": "Missing label"}, 400
 
-    with frame_lock:
-        frame = None if latest_bgr_frame is None else latest_bgr_frame.copy()
-    if frame is None:
+    gray = _latest_gray()
+    if gray is None:
         return {"ok": False, "error": "currently no image available to retrieve"}, 503
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     with FACE_LOCK:
         faces = FACE_CASCADE.detectMultiScale(
             gray,
@@ -719,7 +1151,7 @@ def api_capture():
         return {"ok": False, "error": "No face detected"}, 404
 
     # get max face
-    x, y, w, h = max(faces, key=lambda f: f[2]*f[3])
+    x, y, w, h = _largest_face(faces)
 
     save_dir = os.path.join(RECOG_DATA_DIR, label)
     os.makedirs(save_dir, exist_ok=True)
@@ -744,10 +1176,21 @@ def api_capture():
 def api_current():
     now = time.time()
     with current_people_lock:
-        people = [
-            p for p in current_people
-            if (now - float(p.get("ts", now))) <= CURRENT_EXPIRE_SEC
-        ]
+        n = _people_n
+        bboxes = _people_bbox[:n].tolist()
+        confs = _people_conf[:n].tolist()
+        tss = _people_ts[:n].tolist()
+        names = list(_people_labels[:n])
+    people = [
+        {
+            "label": names[i],
+            "conf": None if confs[i] != confs[i] else confs[i],  # NaN -> null
+            "bbox": bboxes[i],
+            "ts": tss[i],
+        }
+        for i in range(n)
+        if (now - tss[i]) <= CURRENT_EXPIRE_SEC
+    ]
     return {"ok": True, "count": len(people), "people": people, "ts": now}
 
 def _install_signals():
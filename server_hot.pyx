@@ -0,0 +1,117 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""Compiled hot-path kernels for server.py.
+
+Optional: build with `python setup_hot.py build_ext --inplace` on the target
+board; server.py falls back to the numba/pure-Python versions when the
+extension is absent. For a PGO build, compile once with
+CFLAGS="-O3 -fprofile-generate", run a representative stream session, then
+rebuild with CFLAGS="-O3 -fprofile-use".
+"""
+
+import numpy as np
+cimport numpy as cnp
+cimport cython
+
+cnp.import_array()
+
+
+cpdef tuple aggregate_votes(cnp.int32_t[::1] ids, cnp.float32_t[::1] confs, int require):
+    """Majority vote over the prediction window; ids < 0 mean empty/unknown.
+
+    Returns (label_id, mean_conf); label_id is -1 when no label reaches
+    `require` votes. Mirrors server._aggregate_votes.
+    """
+    cdef int n = ids.shape[0]
+    cdef int best_id = -1
+    cdef int best_votes = 0
+    cdef int i, j, votes, m
+    cdef cnp.int32_t v
+    cdef double s
+
+    for i in range(n):
+        v = ids[i]
+        if v < 0:
+            continue
+        votes = 0
+        for j in range(n):
+            if ids[j] == v:
+                votes += 1
+        if votes > best_votes:
+            best_votes = votes
+            best_id = v
+    if best_id < 0 or best_votes < require:
+        return -1, float("nan")
+    s = 0.0
+    m = 0
+    for j in range(n):
+        if ids[j] == best_id and confs[j] == confs[j]:   # NaN check
+            s += confs[j]
+            m += 1
+    return best_id, (s / m) if m > 0 else float("nan")
+
+
+cpdef cnp.ndarray[cnp.float32_t, ndim=1] lbp_histograms(cnp.uint8_t[:, ::1] img, int grid):
+    """Per-cell-normalized 256-bin LBP histograms, flattened; mirrors
+    server._lbp_histograms."""
+    cdef int h = img.shape[0]
+    cdef int w = img.shape[1]
+    cdef cnp.ndarray[cnp.float32_t, ndim=1] hist_arr = np.zeros(grid * grid * 256, np.float32)
+    cdef cnp.float32_t[::1] hist = hist_arr
+    cdef int ch = max(1, h // grid)
+    cdef int cw = max(1, w // grid)
+    cdef int x, y, cx, cy, code, cell, base, k
+    cdef cnp.uint8_t c
+    cdef float s
+
+    for y in range(1, h - 1):
+        cy = y // ch
+        if cy > grid - 1:
+            cy = grid - 1
+        for x in range(1, w - 1):
+            c = img[y, x]
+            code = 0
+            if img[y-1, x-1] >= c: code |= 1
+            if img[y-1, x  ] >= c: code |= 2
+            if img[y-1, x+1] >= c: code |= 4
+            if img[y,   x+1] >= c: code |= 8
+            if img[y+1, x+1] >= c: code |= 16
+            if img[y+1, x  ] >= c: code |= 32
+            if img[y+1, x-1] >= c: code |= 64
+            if img[y,   x-1] >= c: code |= 128
+            cx = x // cw
+            if cx > grid - 1:
+                cx = grid - 1
+            hist[(cy * grid + cx) * 256 + code] += 1.0
+    for cell in range(grid * grid):
+        base = cell * 256
+        s = 0.0
+        for k in range(256):
+            s += hist[base + k]
+        if s > 0:
+            for k in range(256):
+                hist[base + k] /= s
+    return hist_arr
+
+
+cpdef cnp.ndarray[cnp.float32_t, ndim=1] chi2_scores(cnp.float32_t[:, ::1] train_hists,
+                                                     cnp.float32_t[::1] query):
+    """Chi-square distance of the query histogram against every training row;
+    mirrors server._chi2_scores."""
+    cdef int n = train_hists.shape[0]
+    cdef int d = train_hists.shape[1]
+    cdef cnp.ndarray[cnp.float32_t, ndim=1] out_arr = np.empty(n, np.float32)
+    cdef cnp.float32_t[::1] out = out_arr
+    cdef int i, k
+    cdef float a, b, denom, diff, s
+
+    for i in range(n):
+        s = 0.0
+        for k in range(d):
+            a = train_hists[i, k]
+            b = query[k]
+            denom = a + b
+            if denom > 1e-9:
+                diff = a - b
+                s += diff * diff / denom
+        out[i] = s
+    return out_arr
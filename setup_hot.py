@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""Build the optional compiled hot-path module:
+
+    python setup_hot.py build_ext --inplace
+
+server.py picks up server_hot automatically when the extension is present.
+See the module docstring in server_hot.pyx for the PGO recipe.
+"""
+import numpy as np
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+setup(
+    name="server_hot",
+    ext_modules=cythonize(
+        [Extension("server_hot", ["server_hot.pyx"],
+                   include_dirs=[np.get_include()])],
+        annotate=True,
+    ),
+)